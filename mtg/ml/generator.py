@@ -2,9 +2,12 @@ from tensorflow.keras.utils import Sequence
 import numpy as np
 import pandas as pd
 import tensorflow as tf
+from numba import njit, prange
 from mtg.ml.utils import importance_weighting
 import gc
 
+BASICS = frozenset(["plains", "island", "swamp", "mountain", "forest"])
+
 
 class MTGDataGenerator(Sequence):
     def __init__(
@@ -17,7 +20,17 @@ class MTGDataGenerator(Sequence):
         to_fit=True,
         exclude_basics=True,
         store_basics=False,
+        seed=None,
     ):
+        if isinstance(seed, np.random.SeedSequence):
+            self.seed_sequence = seed
+        else:
+            self.seed_sequence = np.random.SeedSequence(seed)
+        # self.rng only shuffles the examples between epochs. Random draws within
+        # a batch come from batch_rng, so they don't depend on the order batches
+        # are assembled in
+        self.rng = np.random.default_rng(self.seed_sequence)
+        self.epoch = 0
         self.cards = cards.sort_values(by="idx", ascending=True)
         self.card_col_prefixes = card_col_prefixes
         self.exclude_basics = exclude_basics
@@ -25,14 +38,28 @@ class MTGDataGenerator(Sequence):
         if self.exclude_basics:
             self.cards = self.cards.iloc[5:, :]
             self.cards["idx"] = self.cards["idx"] - 5
+        self._name_to_idx = dict(
+            zip(self.cards["name"].values, self.cards["idx"].values)
+        )
+        self._idx_to_name = dict(
+            zip(self.cards["idx"].values, self.cards["name"].values)
+        )
         self.batch_size = batch_size
         self.shuffle = shuffle
         self.to_fit = to_fit
         self.n_cards = self.cards.shape[0]
+        # generate_global_data sets self.size to the number of examples (e.g. drafts
+        # rather than rows for DraftGenerator), so subclasses never need to shuffle
+        # the examples a second time once the size is known
         self.generate_global_data(data)
-        self.size = data.shape[0]
-        # generate initial indices for batching the data
-        self.reset_indices()
+        # every batch is a slice of these tables, so check once that they were
+        # stored with contiguous rows
+        for attr in self.example_attrs:
+            example_data = getattr(self, attr)
+            if isinstance(example_data, np.ndarray):
+                assert example_data.flags.c_contiguous, attr
+        # shuffle the examples for the first epoch
+        self.shuffle_examples()
 
     def __len__(self):
         """
@@ -40,23 +67,58 @@ class MTGDataGenerator(Sequence):
         """
         return self.size // self.batch_size
 
-    def reset_indices(self):
-        self.indices = np.arange(self.size)
+    def shuffle_examples(self):
+        """
+        Shuffle the per-example data itself, so every batch in the epoch is a
+            contiguous slice rather than a gather through shuffled indices.
+            This copies the whole dataset every epoch: each table briefly coexists
+            with its permuted copy, and batches still referencing the previous
+            epoch keep the old tables alive, so peak memory can reach double the
+            size of the data held by both the train and val generators
+        """
         if self.shuffle == True:
-            np.random.shuffle(self.indices)
+            perm = self.rng.permutation(self.size)
+            for attr in self.example_attrs:
+                example_data = getattr(self, attr)
+                if isinstance(example_data, np.ndarray):
+                    # take on a C-ordered table returns a C-ordered copy, so the
+                    # slices stay contiguous epoch after epoch
+                    setattr(self, attr, np.take(example_data, perm, axis=0))
+                elif example_data is not None:
+                    setattr(self, attr, example_data[perm])
 
     def on_epoch_end(self):
         """
-        Update indices after each epoch
+        Reshuffle the examples after each epoch
         """
-        self.reset_indices()
+        self.epoch += 1
+        self.shuffle_examples()
         gc.collect()
 
     def card_name_to_idx(self, card_name, exclude_basics=True):
-        return self.cards[self.cards["name"] == card_name]["idx"].iloc[0]
+        return self._name_to_idx[card_name]
 
     def card_idx_to_name(self, card_idx, exclude_basics=True):
-        return self.cards[self.cards["idx"] == card_idx]["name"].iloc[0]
+        return self._idx_to_name[card_idx]
+
+    def get_card_columns(self, columns):
+        """
+        Group the card columns by prefix in a single pass over the columns
+        return: a dict mapping each prefix to its card columns, without the basics
+            if exclude_basics, and a dict mapping each prefix to its basics columns
+        """
+        exclude_cards = BASICS if self.exclude_basics else frozenset()
+        card_cols = {prefix: [] for prefix in self.card_col_prefixes}
+        basic_cols = {prefix: [] for prefix in self.card_col_prefixes}
+        for col in columns:
+            for prefix in self.card_col_prefixes:
+                if col.startswith(prefix + "_"):
+                    card_name = col[len(prefix) + 1 :]
+                    if card_name not in exclude_cards:
+                        card_cols[prefix].append(col)
+                    if card_name in BASICS:
+                        basic_cols[prefix].append(col)
+        return card_cols, basic_cols
 
     def generate_global_data(self, data):
         self.all_cards = [
@@ -64,30 +126,38 @@ class MTGDataGenerator(Sequence):
             for col in data.columns
             if col.startswith(self.card_col_prefixes[0])
         ]
-        basics = ["plains", "island", "swamp", "mountain", "forest"]
-        if self.exclude_basics:
-            exclude_cards = basics
-        else:
-            exclude_cards = []
+        card_cols, basic_cols = self.get_card_columns(data.columns)
         for prefix in self.card_col_prefixes:
-            cols = [
-                col
-                for col in data.columns
-                if col.startswith(prefix + "_")
-                and not any([x in col for x in exclude_cards])
-            ]
-            setattr(self, prefix, data[cols].values)
+            cols = card_cols[prefix]
+            # pandas hands back column-major blocks, so convert to an explicit dtype
+            # and make rows contiguous once here rather than paying for a strided
+            # gather on every batch. Card counts are small non-negative integers,
+            # so uint8 is enough to store them
+            setattr(
+                self,
+                prefix,
+                np.ascontiguousarray(data[cols].to_numpy(dtype=np.uint8)),
+            )
             if self.store_basics:
-                basic_cols = [
-                    col
-                    for col in data.columns
-                    if any([prefix + "_" + x == col for x in basics])
-                ]
-                setattr(self, prefix + "_basics", data[basic_cols].values)
+                setattr(
+                    self,
+                    prefix + "_basics",
+                    np.ascontiguousarray(
+                        data[basic_cols[prefix]].to_numpy(dtype=np.uint8)
+                    ),
+                )
         if "ml_weights" in data.columns:
-            self.weights = data["ml_weights"].values
+            # float32 to match the model outputs the weights are multiplied into
+            self.weights = data["ml_weights"].to_numpy(dtype=np.float32)
         else:
             self.weights = None
+        self.size = data.shape[0]
+        # attributes holding one entry per example, shuffled together each epoch
+        self.example_attrs = self.card_col_prefixes + ["weights"]
+        if self.store_basics:
+            self.example_attrs += [
+                prefix + "_basics" for prefix in self.card_col_prefixes
+            ]
 
     def __getitem__(self, batch_number):
         """
@@ -95,19 +165,116 @@ class MTGDataGenerator(Sequence):
         param batch_number: which batch to generate
         return: X and y when fitting. X only when predicting
         """
-        indices = self.indices[
-            batch_number * self.batch_size : (batch_number + 1) * self.batch_size
-        ]
-        X, y, weights = self.generate_data(indices)
+        indices = slice(
+            batch_number * self.batch_size, (batch_number + 1) * self.batch_size
+        )
+        X, y, weights = self.generate_data(indices, self.batch_rng(batch_number))
 
         if self.to_fit:
             return X, y, weights
         else:
             return X
 
-    def generate_data(self, indices):
+    def batch_rng(self, batch_number):
+        """
+        return: numpy Generator seeded by the generator's seed, the epoch and the
+            batch number, so a batch draws the same random numbers no matter
+            which thread assembles it or in what order
+        """
+        return np.random.default_rng(
+            np.random.SeedSequence(
+                self.seed_sequence.entropy,
+                spawn_key=self.seed_sequence.spawn_key + (self.epoch, batch_number),
+            )
+        )
+
+    def generate_data(self, indices, rng):
         raise NotImplementedError
 
+    def batch_signature(self):
+        """
+        return: (X, y, weights) structure of tf.TensorSpec describing the output of
+            generate_data, with weights set to None when there are no weights
+        """
+        raise NotImplementedError
+
+    def as_dataset(self, device=None, num_parallel_calls=None):
+        """
+        Wrap one epoch of batches in a tf.data pipeline so that batch assembly
+        runs in the background and overlaps with the training step
+        param device: if specified (e.g. "/GPU:0"), batches are prefetched onto
+            this device to remove the host->device copy from the step time
+        param num_parallel_calls: if specified (e.g. tf.data.AUTOTUNE), batches
+            are assembled by this many worker threads instead of a single
+            background generator. Batches are views into the shared numpy tables,
+            so workers don't copy the data, and batch order is preserved. Each
+            batch draws from its own batch_rng, so the batches are identical to
+            the serial ones. Both tf.py_function and the numba kernels (compiled
+            without nogil) hold the GIL, so only numpy operations that release
+            it actually overlap between workers
+        return: tf.data.Dataset of (X, y, weights), or (X, y) when there are no
+            weights, since tf.data cannot carry None. X only when predicting
+        """
+
+        def get_batch(batch_number):
+            batch = self[batch_number]
+            if self.to_fit and batch[-1] is None:
+                batch = batch[:-1]
+            return batch
+
+        # built from the stored tables rather than a sample batch, so calling this
+        # every epoch neither assembles extra batches nor consumes random draws
+        X_spec, y_spec, weights_spec = self.batch_signature()
+        if not self.to_fit:
+            output_signature = X_spec
+        elif weights_spec is None:
+            output_signature = (X_spec, y_spec)
+        else:
+            output_signature = (X_spec, y_spec, weights_spec)
+        if num_parallel_calls is None:
+
+            def batches():
+                for batch_number in range(len(self)):
+                    yield get_batch(batch_number)
+
+            dataset = tf.data.Dataset.from_generator(
+                batches, output_signature=output_signature
+            )
+        else:
+            flat_signature = tf.nest.flatten(output_signature)
+
+            def load_batch(batch_number):
+                return tf.nest.flatten(get_batch(int(batch_number)))
+
+            def parallel_batch(batch_number):
+                flat_batch = tf.py_function(
+                    load_batch, [batch_number], [spec.dtype for spec in flat_signature]
+                )
+                for tensor, spec in zip(flat_batch, flat_signature):
+                    tensor.set_shape(spec.shape)
+                return tf.nest.pack_sequence_as(output_signature, flat_batch)
+
+            dataset = tf.data.Dataset.range(len(self)).map(
+                parallel_batch, num_parallel_calls=num_parallel_calls
+            )
+        dataset = dataset.prefetch(tf.data.AUTOTUNE)
+        if device is not None:
+            dataset = dataset.apply(tf.data.experimental.prefetch_to_device(device))
+        return dataset
+
+    def prefetched_batches(self, device=None, num_parallel_calls=None):
+        """
+        Iterate over one epoch of batches from `as_dataset`
+        return: generator of (X, y, weights) with weights set back to None when
+            the generator has no weights
+        """
+        dataset = self.as_dataset(device=device, num_parallel_calls=num_parallel_calls)
+        for batch in dataset:
+            if self.to_fit and len(batch) == 2:
+                yield (*batch, None)
+            else:
+                yield batch
+
 
 class DraftGenerator(MTGDataGenerator):
     def __init__(
@@ -119,6 +286,7 @@ class DraftGenerator(MTGDataGenerator):
         to_fit=True,
         exclude_basics=True,
         store_basics=False,
+        seed=None,
     ):
         super().__init__(
             data,
@@ -129,82 +297,125 @@ class DraftGenerator(MTGDataGenerator):
             to_fit=to_fit,
             exclude_basics=exclude_basics,
             store_basics=store_basics,
+            seed=seed,
         )
-        # overwrite the size to make sure we always sample full drafts
-        self.size = len(self.draft_ids)
-        self.reset_indices()
 
     def generate_global_data(self, data):
+        # sort so that each draft is a contiguous block of t rows, which lets every
+        # table be reshaped to (n_drafts, t, ...) and indexed directly by draft
+        data = data.sort_values(by=["draft_id", "position"])
         self.draft_ids = data["draft_id"].unique()
         self.t = data["position"].max() + 1
-        data = data.set_index(["draft_id", "position"])
+        n_drafts = len(self.draft_ids)
+        # the size is the number of drafts to make sure we always sample full drafts
+        self.size = n_drafts
         self.all_cards = [
             col.split("_", 1)[-1]
             for col in data.columns
             if col.startswith(self.card_col_prefixes[0])
         ]
-        basics = ["plains", "island", "swamp", "mountain", "forest"]
-        if self.exclude_basics:
-            exclude_cards = basics
-        else:
-            exclude_cards = []
+        card_cols, basic_cols = self.get_card_columns(data.columns)
+        card_blocks = []
         for prefix in self.card_col_prefixes:
-            cols = [
-                col
-                for col in data.columns
-                if col.startswith(prefix + "_")
-                and not any([x in col for x in exclude_cards])
-            ]
-            setattr(self, prefix, data[cols])
+            cols = card_cols[prefix]
+            card_blocks.append(data[cols].to_numpy(dtype=np.int8))
             if self.store_basics:
-                basic_cols = [
-                    col
-                    for col in data.columns
-                    if any([prefix + "_" + x == col for x in basics])
-                ]
-                setattr(self, prefix + "_basics", data[basic_cols])
+                setattr(
+                    self,
+                    prefix + "_basics",
+                    np.ascontiguousarray(
+                        data[basic_cols[prefix]].to_numpy(dtype=np.int8)
+                    ).reshape(n_drafts, self.t, -1),
+                )
+        # the card blocks (e.g. packs and pools) are always fed to the model side by
+        # side, so store them concatenated once rather than concatenating per batch.
+        # They are card counts, so int8 keeps the host->device copy small and the
+        # model casts them to float. to_numpy hands back column-major blocks, and
+        # concatenate keeps that layout, so make the rows contiguous before the
+        # reshape or every batch slice of draft_info is a strided gather
+        self.draft_info = np.ascontiguousarray(
+            np.concatenate(card_blocks, axis=-1)
+        ).reshape(n_drafts, self.t, -1)
         if "ml_weights" in data.columns:
-            self.weights = data["ml_weights"]
+            # float32 to match the model outputs the weights are multiplied into
+            self.weights = (
+                data["ml_weights"].to_numpy(dtype=np.float32).reshape(n_drafts, self.t)
+            )
         else:
             self.weights = None
         name_to_idx_mapping = {
             k.split("//")[0].strip().lower(): v
             for k, v in self.cards.set_index("name")["idx"].to_dict().items()
         }
-        self.pick = data["pick"].apply(lambda x: name_to_idx_mapping[x])
-        self.shifted_pick = self.pick.groupby(level=0).shift(1).fillna(self.n_cards)
+        self.pick = (
+            data["pick"]
+            .apply(lambda x: name_to_idx_mapping[x])
+            .to_numpy(dtype=np.int32)
+            .reshape(n_drafts, self.t)
+        )
+        # picks and positions are kept as their own contiguous int32 tables next to
+        # draft_info. The pick at each position is the previous pick in the draft,
+        # and the first position gets the padding index
+        self.shifted_pick = np.full_like(self.pick, self.n_cards)
+        self.shifted_pick[:, 1:] = self.pick[:, :-1]
         self.position = (
-            data["pack_number"] * (data["pick_number"].max() + 1) + data["pick_number"]
+            (
+                data["pack_number"] * (data["pick_number"].max() + 1)
+                + data["pick_number"]
+            )
+            .to_numpy(dtype=np.int32)
+            .reshape(n_drafts, self.t)
         )
+        # attributes holding one entry per draft, shuffled together each epoch
+        self.example_attrs = [
+            "draft_ids",
+            "draft_info",
+            "pick",
+            "shifted_pick",
+            "position",
+            "weights",
+        ]
+        if self.store_basics:
+            self.example_attrs += [
+                prefix + "_basics" for prefix in self.card_col_prefixes
+            ]
 
-    def generate_data(self, indices):
-        draft_ids = self.draft_ids[indices]
-        packs = self.pack_card.loc[draft_ids].values.reshape(
-            len(indices), self.t, len(self.pack_card.columns)
-        )
-        # pools = self.pool.loc[draft_ids].values.reshape(len(indices), self.t, len(self.pack_card.columns))
-        picks = self.pick.loc[draft_ids].values.reshape(len(indices), self.t)
-        shifted_picks = self.shifted_pick.loc[draft_ids].values.reshape(
-            len(indices), self.t
-        )
-        positions = self.position.loc[draft_ids].values.reshape(len(indices), self.t)
-        # draft_info = np.concatenate([packs, pools], axis=-1)
+    def generate_data(self, indices, rng):
+        draft_info = self.draft_info[indices]
+        picks = self.pick[indices]
+        shifted_picks = self.shifted_pick[indices]
+        positions = self.position[indices]
         if self.weights is not None:
             # comment below is if weights sum to 1 for each draft rather than for each batch
-            # weights = (self.weights.loc[draft_ids]/self.weights.loc[draft_ids].groupby(level=0).sum()).values.reshape(len(indices), self.t)
-            weights = (
-                self.weights.loc[draft_ids] / self.weights.loc[draft_ids].sum()
-            ).values.reshape(len(indices), self.t)
+            # weights = batch_weights / batch_weights.sum(axis=1, keepdims=True)
+            batch_weights = self.weights[indices]
+            # batches are views into self.weights, so normalize into a new array
+            weights = batch_weights * (1.0 / batch_weights.sum())
         else:
             weights = None
-        # convert to tensor needed for #tf.function
-        packs = tf.convert_to_tensor(packs.astype(np.float32), dtype=tf.float32)
-        positions = tf.convert_to_tensor(positions.astype(np.int32), dtype=tf.int32)
-        picks = tf.convert_to_tensor(picks.astype(np.float32), dtype=tf.int32)
-        shifted_picks = tf.convert_to_tensor(
-            shifted_picks.astype(np.float32), dtype=tf.int32
+        # convert to tensor needed for #tf.function. The tables are stored with
+        # these dtypes in generate_global_data, so no per-batch cast is needed
+        draft_info = tf.convert_to_tensor(draft_info, dtype=tf.int8)
+        positions = tf.convert_to_tensor(positions, dtype=tf.int32)
+        picks = tf.convert_to_tensor(picks, dtype=tf.int32)
+        shifted_picks = tf.convert_to_tensor(shifted_picks, dtype=tf.int32)
+        return (draft_info, shifted_picks, positions), picks, weights
+
+    def batch_signature(self):
+        t = int(self.t)
+        draft_info_spec = tf.TensorSpec(
+            shape=(None, t, self.draft_info.shape[-1]), dtype=tf.int8
+        )
+        sequence_spec = tf.TensorSpec(shape=(None, t), dtype=tf.int32)
+        if self.weights is not None:
+            weights_spec = tf.TensorSpec(shape=(None, t), dtype=tf.float32)
+        else:
+            weights_spec = None
+        return (
+            (draft_info_spec, sequence_spec, sequence_spec),
+            sequence_spec,
+            weights_spec,
         )
-        return (packs, shifted_picks, positions), picks, weights
 
 
 class DeckGenerator(MTGDataGenerator):
@@ -219,6 +430,7 @@ class DeckGenerator(MTGDataGenerator):
         store_basics=True,
         pos_neg_sample=False,
         mask_decks=False,
+        seed=None,
     ):
         super().__init__(
             data,
@@ -229,11 +441,25 @@ class DeckGenerator(MTGDataGenerator):
             to_fit=to_fit,
             exclude_basics=exclude_basics,
             store_basics=store_basics,
+            seed=seed,
         )
         self.pos_neg_sample = pos_neg_sample
         self.mask_decks = mask_decks
+        if self.pos_neg_sample:
+            # compile sample_triples and start numba's thread pool here, on the
+            # constructing thread: as_dataset otherwise makes the first call from
+            # a tf.data worker, which leaves the OpenMP pool hanging at exit
+            sampled = np.empty(1, dtype=np.int64)
+            sample_triples(
+                self.deck[:1],
+                self.sideboard[:1],
+                np.zeros((1, 3)),
+                sampled,
+                sampled.copy(),
+                sampled.copy(),
+            )
 
-    def generate_data(self, indices):
+    def generate_data(self, indices, rng):
         decks = self.deck[indices, :]
         sideboards = self.sideboard[indices, :]
         basics = self.deck_basics[indices, :]
@@ -241,44 +467,75 @@ class DeckGenerator(MTGDataGenerator):
             max_n_non_basics = np.max(decks.sum(axis=1))
             n = max_n_non_basics + 2
             basics = np.repeat(basics[:, None, :], n, axis=1)
-            masked_decks = self.create_masked_objects(decks, n=n)
+            masked_decks = self.create_masked_objects(decks, n, rng)
             # this is set up so the first element in masked decks has an empty
             # deck to predict from the whole pool, and the last element has a fully
             # built deck where the only thing to predict is the basics
             masked_decks[:, -1, :] = decks
-            masked_decks = masked_decks.astype(np.float32)
-            cards_to_add = (decks[:, None, :] - masked_decks).astype(np.float32)
-            modified_sideboards = (sideboards[:, None, :] + cards_to_add).astype(
-                np.float32
-            )
+            # masked_decks is float32, so these are float32 without another cast
+            cards_to_add = decks[:, None, :] - masked_decks
+            modified_sideboards = sideboards[:, None, :] + cards_to_add
             X = (modified_sideboards, masked_decks)
             Y = (basics.astype(np.float32), cards_to_add)
         else:
-            X = (decks + sideboards).astype(np.float32)
+            X = np.add(decks, sideboards, dtype=np.float32)
             Y = (basics.astype(np.float32), decks.astype(np.float32))
         if self.weights is not None:
+            batch_weights = self.weights[indices]
             if self.mask_decks:
-                weights = self.weights[indices][:, None] * np.ones((len(indices), n))
+                # every masked sample of a deck shares its weight, so the weights
+                # over the batch sum to n times the deck weights
+                weights = np.repeat(
+                    batch_weights[:, None]
+                    * np.float32(1.0 / (n * batch_weights.sum())),
+                    n,
+                    axis=1,
+                )
             else:
-                weights = self.weights[indices]
-            weights = weights / weights.sum()
+                # batches are views into self.weights, so normalize into a new array
+                weights = batch_weights * (1.0 / batch_weights.sum())
         else:
             weights = None
         if self.pos_neg_sample:
-            anchor, pos, neg = self.sample_card_pairs(decks, sideboards)
+            anchor, pos, neg = self.sample_card_pairs(decks, sideboards, rng)
+            X = X if self.mask_decks else (X,)
             return (*X, anchor, pos, neg), Y, weights
         return X, Y, weights
 
-    def create_masked_objects(self, decks, n):
-        masked_decks = np.zeros((decks.shape[0], n, decks.shape[1]))
-        for i in range(1, n):
-            masked_decks[:, i, :] = self.get_vectorized_sample(
-                decks.copy(), n=i, uniform=True
-            )
+    def batch_signature(self):
+        n_cards = self.deck.shape[1]
+        n_basics = self.deck_basics.shape[1]
+        # masked decks add a (variable sized) axis of masked samples per deck
+        sample_shape = (None, None) if self.mask_decks else (None,)
+        card_spec = tf.TensorSpec(shape=sample_shape + (n_cards,), dtype=tf.float32)
+        basic_spec = tf.TensorSpec(shape=sample_shape + (n_basics,), dtype=tf.float32)
+        if self.mask_decks:
+            X_spec = (card_spec, card_spec)
+        else:
+            X_spec = card_spec
+        if self.pos_neg_sample:
+            X_spec = X_spec if self.mask_decks else (X_spec,)
+            idx_spec = tf.TensorSpec(shape=(None,), dtype=tf.int64)
+            X_spec = (*X_spec, idx_spec, idx_spec, idx_spec)
+        if self.weights is not None:
+            weights_spec = tf.TensorSpec(shape=sample_shape, dtype=tf.float32)
+        else:
+            weights_spec = None
+        return X_spec, (basic_spec, card_spec), weights_spec
+
+    def create_masked_objects(self, decks, n, rng):
+        masked_decks = np.zeros((decks.shape[0], n, decks.shape[1]), dtype=np.float32)
+        # the last element is overwritten with the full deck by the caller, so it
+        # doesn't need to be sampled
+        for i in range(1, n - 1):
+            # copy the decks straight into their slot and sample cards out of that
+            # view in place, rather than sampling from a fresh copy of the decks
+            masked_decks[:, i, :] = decks
+            self.get_vectorized_sample(masked_decks[:, i, :], rng, n=i, uniform=True)
         return masked_decks
 
     def get_vectorized_sample(
-        self, mtx, n=1, uniform=True, return_mtx=True, modify_mtx=True
+        self, mtx, rng, n=1, uniform=True, return_mtx=True, modify_mtx=True
     ):
         if uniform:
             clip_mtx = np.clip(mtx, 0, 1)
@@ -286,14 +543,26 @@ class DeckGenerator(MTGDataGenerator):
         else:
             probabilities = mtx / (mtx.sum(1, keepdims=True) + 1e-9)
         live_idxs = np.where(mtx.sum(1) != 0)
-        cumulative_dist = probabilities.cumsum(axis=1)
-        random_bin = np.random.rand(len(cumulative_dist), 1)
-        sample = (random_bin < cumulative_dist).argmax(axis=1)
+        # accumulate in float64: masked decks are float32, and once the row offsets
+        # below are added float32 can no longer resolve card boundaries within a row
+        cumulative_dist = probabilities.cumsum(axis=1, dtype=np.float64)
+        n_rows, n_cols = cumulative_dist.shape
+        random_bin = rng.random(n_rows)
+        # offset each row's cumulative distribution by its row number so that one
+        # searchsorted over the flattened matrix does a binary search per row,
+        # rather than materializing a (rows x cards) comparison matrix
+        row_offsets = np.arange(n_rows)
+        cumulative_dist += row_offsets[:, None]
+        sample = np.searchsorted(
+            cumulative_dist.ravel(), random_bin + row_offsets, side="right"
+        ) - (row_offsets * n_cols)
+        # rows with nothing to sample run past their end, default them to 0
+        sample[sample >= n_cols] = 0
         if modify_mtx:
             mtx[live_idxs, sample[live_idxs]] -= 1
         if n > 1:
             cts_sample = self.get_vectorized_sample(
-                mtx, n=n - 1, uniform=uniform, return_mtx=False
+                mtx, rng, n=n - 1, uniform=uniform, return_mtx=False
             )
             if len(cts_sample.shape) == 1:
                 cts_sample = np.expand_dims(cts_sample, 1)
@@ -302,28 +571,64 @@ class DeckGenerator(MTGDataGenerator):
             return mtx
         return sample
 
-    def sample_card_pairs(self, decks, sideboards):
-        anchors = self.get_vectorized_sample(
-            decks, uniform=False, return_mtx=False, modify_mtx=False
+    def sample_card_pairs(self, decks, sideboards, rng):
+        anchors = np.empty(decks.shape[0], dtype=np.int64)
+        positive_samples = np.empty(decks.shape[0], dtype=np.int64)
+        negative_samples = np.empty(decks.shape[0], dtype=np.int64)
+        uniforms = rng.random((decks.shape[0], 3))
+        sample_triples(
+            decks, sideboards, uniforms, anchors, positive_samples, negative_samples
         )
+        return anchors, positive_samples, negative_samples
 
-        # never sample the same card as the anchor as the positive or negative axample
-        decks_without_anchors = decks.copy()
-        decks_without_anchors[np.arange(decks.shape[0]), anchors] = 0
-        sideboards_without_anchors = sideboards.copy()
-        sideboards_without_anchors[np.arange(decks.shape[0]), anchors] = 0
 
-        positive_samples = self.get_vectorized_sample(
-            decks_without_anchors, uniform=False, return_mtx=False, modify_mtx=False
-        )
-        negative_samples = self.get_vectorized_sample(
-            sideboards_without_anchors,
-            uniform=False,
-            return_mtx=False,
-            modify_mtx=False,
-        )
+@njit(parallel=True, fastmath=True)
+def sample_triples(decks, sides, uniforms, out_a, out_p, out_n):
+    """
+    For each row, sample an anchor card from the deck with probability proportional
+        to its count, then a positive card from the deck and a negative card from the
+        sideboard, never sampling the anchor as the positive or negative example.
+        uniforms holds the three uniform draws in [0, 1) used for each row.
 
-        return anchors, positive_samples, negative_samples
+    This walks each row once for the anchor and once for both the positive and
+        negative, without allocating (batch x n_cards) temporaries, and runs in
+        parallel across rows. Rows with no cards to sample from yield index 0.
+    """
+    n_cards = decks.shape[1]
+    for i in prange(decks.shape[0]):
+        deck_total = 0.0
+        side_total = 0.0
+        for j in range(n_cards):
+            deck_total += decks[i, j]
+            side_total += sides[i, j]
+        target = uniforms[i, 0] * deck_total
+        cumulative = 0.0
+        anchor = 0
+        for j in range(n_cards):
+            cumulative += decks[i, j]
+            if cumulative > target:
+                anchor = j
+                break
+        pos_target = uniforms[i, 1] * (deck_total - decks[i, anchor])
+        neg_target = uniforms[i, 2] * (side_total - sides[i, anchor])
+        pos_cumulative = 0.0
+        neg_cumulative = 0.0
+        positive = -1
+        negative = -1
+        for j in range(n_cards):
+            if j == anchor:
+                continue
+            pos_cumulative += decks[i, j]
+            neg_cumulative += sides[i, j]
+            if positive < 0 and pos_cumulative > pos_target:
+                positive = j
+            if negative < 0 and neg_cumulative > neg_target:
+                negative = j
+            if positive >= 0 and negative >= 0:
+                break
+        out_a[i] = anchor
+        out_p[i] = max(positive, 0)
+        out_n[i] = max(negative, 0)
 
 
 def create_train_and_val_gens(
@@ -338,24 +643,30 @@ def create_train_and_val_gens(
     exclude_basics=True,
     generator=MTGDataGenerator,
     include_val=True,
+    seed=None,
     **kwargs,
 ):
+    # independent random streams for the split and each generator
+    split_seed, train_seed, val_seed = np.random.SeedSequence(seed).spawn(3)
+    rng = np.random.default_rng(split_seed)
     if weights and "ml_weights" not in data.columns:
         data["ml_weights"] = importance_weighting(data)
     if train_p < 1.0:
         if id_col is None:
             idxs = np.arange(data.shape[0])
-            train_idxs = np.random.choice(idxs, int(len(idxs) * train_p), replace=False)
-            test_idxs = np.asarray(
-                list(set(idxs.flatten()) - set(train_idxs.flatten()))
-            )
-            train_data = data[train_idxs, :]
-            test_data = data[test_idxs, :]
+            train_idxs = rng.choice(idxs, int(len(idxs) * train_p), replace=False)
+            test_mask = np.ones(len(idxs), dtype=bool)
+            test_mask[train_idxs] = False
+            test_idxs = idxs[test_mask]
+            train_data = data.iloc[train_idxs]
+            test_data = data.iloc[test_idxs]
         else:
             idxs = data[id_col].unique()
-            train_idxs = np.random.choice(idxs, int(len(idxs) * train_p), replace=False)
-            train_data = data[data[id_col].isin(train_idxs)]
-            test_data = data[~data[id_col].isin(train_idxs)]
+            train_idxs = rng.choice(idxs, int(len(idxs) * train_p), replace=False)
+            # a single hashed lookup of every row's id, reused for both splits
+            train_mask = pd.Index(train_idxs).get_indexer(data[id_col]) >= 0
+            train_data = data[train_mask]
+            test_data = data[~train_mask]
         n_train = int(len(idxs) * train_p)
         n_test = len(idxs) - n_train
     else:
@@ -368,6 +679,7 @@ def create_train_and_val_gens(
         shuffle=shuffle,
         to_fit=to_fit,
         exclude_basics=exclude_basics,
+        seed=train_seed,
         **kwargs,
     )
     if test_data is not None and include_val:
@@ -380,6 +692,7 @@ def create_train_and_val_gens(
             shuffle=shuffle,
             to_fit=to_fit,
             exclude_basics=exclude_basics,
+            seed=val_seed,
             **kwargs,
         )
     else:
@@ -142,6 +142,8 @@ class DraftBot(tf.Module):
         return_attention=False,
     ):
         packs, picks, positions = features
+        # packs may arrive as int8 card counts to keep host->device copies small
+        packs = tf.cast(packs, tf.float32)
         # store last data batch in case specific batch of data causes an issue
         self.last_packs = packs
         self.last_picks = picks
@@ -386,7 +388,7 @@ class DraftBot(tf.Module):
         """
         if sample_weight is None:
             sample_weight = tf.ones_like(true.shape) / (true.shape[0] * true.shape[1])
-        sample_weight = sample_weight.flatten()
+        sample_weight = tf.reshape(sample_weight, [-1])
         pred, _ = pred
         top1 = tf.reduce_sum(
             tf.keras.metrics.sparse_top_k_categorical_accuracy(true, pred, 1)
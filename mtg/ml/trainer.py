@@ -18,6 +18,8 @@ class Trainer:
         val_weights=None,
         clip=5.0,
         loss_agg_f=lambda x: np.sum(x),
+        prefetch_device=None,
+        num_parallel_calls=None,
     ):
         self.generator = generator
         self.val_generator = val_generator
@@ -35,6 +37,10 @@ class Trainer:
         self.val_features = val_features
         self.val_target = val_target
         self.val_weights = val_weights
+        # when training from generators, batches are prefetched on this device
+        self.prefetch_device = prefetch_device
+        # number of threads assembling generator batches, None for a single one
+        self.num_parallel_calls = num_parallel_calls
 
         if self.generator is not None:
             assert self.features is None
@@ -103,6 +109,16 @@ class Trainer:
             self.epoch_n += 1
             if self.batch_ids is not None:
                 np.random.shuffle(self.batch_ids)
+            if self.generator is not None:
+                batches = self.generator.prefetched_batches(
+                    device=self.prefetch_device,
+                    num_parallel_calls=self.num_parallel_calls,
+                )
+            if self.val_generator is not None:
+                val_batches = self.val_generator.prefetched_batches(
+                    device=self.prefetch_device,
+                    num_parallel_calls=self.num_parallel_calls,
+                )
             if verbose:
                 progress = tqdm(
                     total=n_batches, desc=f"Epoch {self.epoch_n}/{end_at}", unit="Batch"
@@ -123,7 +139,7 @@ class Trainer:
                     else:
                         batch_weights = None
                 else:
-                    batch_features, batch_target, batch_weights = self.generator[i]
+                    batch_features, batch_target, batch_weights = next(batches)
                 loss, metrics = self._step(
                     batch_features,
                     batch_target,
@@ -142,7 +158,7 @@ class Trainer:
                     extras[attr_name].append(attr)
 
                 if self.val_generator is not None:
-                    val_features, val_target, val_weights = self.val_generator[i]
+                    val_features, val_target, val_weights = next(val_batches)
                     # must get attention here to serialize the input for saving
                     val_output = self.model(val_features, training=False)
                     val_loss = self.model.loss(
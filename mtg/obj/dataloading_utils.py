@@ -14,11 +14,8 @@ def load_data(filename, cards, name=None):
 
 def sort_cols_by_card_idxs(df, card_col_prefixes, cards):
     # initialize columns to start with the non-card columns
-    column_order = [
-        c
-        for c in df.columns
-        if not any([c.startswith(prefix) for prefix in card_col_prefixes])
-    ]
+    card_prefixes = tuple(card_col_prefixes)
+    column_order = [c for c in df.columns if not c.startswith(card_prefixes)]
     card_names = cards.sort_values(by="idx", ascending=True)["name"].tolist()
     for prefix in card_col_prefixes:
         prefix_columns = [prefix + "_" + name for name in card_names]
@@ -53,12 +50,7 @@ def load_bo1_data(filename, cards):
     data_types = {}
     draft_cols = []
     for c in col_names:
-        if any(
-            [
-                c.startswith(prefix)
-                for prefix in ["sideboard_", "deck_", "drawn_", "opening_hand_"]
-            ]
-        ):
+        if c.startswith(("sideboard_", "deck_", "drawn_", "opening_hand_")):
             draft_cols.append(c)
         for (r, t) in COLUMN_REGEXES.items():
             if r.match(c):
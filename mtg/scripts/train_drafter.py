@@ -56,7 +56,7 @@ def main():
     x, y, z = train_gen[0]
     (packs, shifted_picks, positions) = x
     model_input = (
-        tf.expand_dims(packs[0], 0),
+        tf.expand_dims(tf.cast(packs[0], tf.float32), 0),
         tf.expand_dims(shifted_picks[0], 0),
         tf.expand_dims(positions[0], 0),
     )